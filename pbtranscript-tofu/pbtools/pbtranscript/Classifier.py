@@ -1,19 +1,48 @@
 """Define class `Classifier` and `ClassifierException`."""
 import os, sys
+import errno
 import os.path as op
 import math
 import re
 import logging
-import multiprocessing
-from collections import defaultdict, namedtuple
-from pbcore.util.Process import backticks
-from pbcore.io.FastaIO import FastaReader, FastaWriter
+import subprocess
+import tempfile
+import hashlib
+import heapq
+import json
+import numpy as np
+from collections import namedtuple
+from pbcore.io.FastaIO import FastaReader
 from pbtools.pbtranscript.PBTranscriptException import PBTranscriptException
-from pbtools.pbtranscript.io.DOMIO import DOMReader
+from pbtools.pbtranscript.io.DOMIO import DOMRecord, DOMReader
 from pbtools.pbtranscript.io.ReadAnnotation import ReadAnnotation
 from pbtools.pbtranscript.io.Summary import ClassifySummary
 from pbtools.pbtranscript.Utils import revcmp, realpath, \
-    generateChunkedFN, cat_files
+    generateChunkedFN, cat_files, append_files, BatchWriter
+
+try:
+    import pyhmmer
+    # TextSequence(name=str) and TopHits.query need pyhmmer 0.11 or later,
+    # fall back to running phmmer with older versions.
+    if tuple(int(v) for v in re.match(r"(\d+)\.(\d+)",
+                                      pyhmmer.__version__).groups()) < (0, 11):
+        raise ImportError("pyhmmer >= 0.11 is required")
+    from pyhmmer.easel import Alphabet, SequenceFile, TextSequence, \
+        DigitalSequenceBlock
+    from pyhmmer.plan7 import Builder, Background
+    from pyhmmer.hmmer import phmmer
+    HAVE_PYHMMER = True
+except ImportError:
+    HAVE_PYHMMER = False
+
+try:
+    # mmap based FASTA reader of the BioReaders extension is much faster
+    # to scan large reads files than pbcore FastaReader, and polyA_start
+    # backtraces polyA tails 8 bases at a time.
+    from pbtools.pbtranscript.BioReaders import SimpleFastaReader, \
+        polyA_start
+except ImportError:
+    SimpleFastaReader, polyA_start = FastaReader, None
 
 
 PBMATRIXFN = "PBMATRIX.txt"
@@ -24,6 +53,20 @@ PRIMERREPORTFN = "primer_info.csv"
 FRONTENDDOMFN = "hmmer.front_end.dom"
 CHIMERADOMFN = "hmmer.chimera.dom"
 CLASSIFYSUMMARY = "classify_summary.txt"
+# PBMATRIX.txt is BLOSUM62, pyhmmer only accepts built-in matrix names.
+PBMATRIXNAME = "BLOSUM62"
+# Buffer size of DOM files to parse and pipes which feed reads to phmmer.
+IO_BUFFER_SIZE = 1 << 17
+# Number of reads trimmed and checked for chimeras at a time when primers
+# are searched in-process, see Classifier.runInProcess.
+READS_PER_BATCH = 10000
+# Minimum number of reads searched by each phmmer process, so that tiny
+# inputs are not split into chunks of a few reads, each paying for starting
+# a phmmer. It is kept low because inputs of fewer than
+# MIN_READS_PER_PHMMER * cpus / phmmer_threads reads run fewer phmmers than
+# cpus, and threads of a phmmer do not make up for it: they only split the
+# search over targets, the few primers.
+MIN_READS_PER_PHMMER = 100
 
 
 # ChimeraDetectionOptions:
@@ -37,6 +80,14 @@ ChimeraDetectionOptions = namedtuple("ChimeraDetectionOptions",
      "primer_search_window"))
 
 
+# Patterns of PacBio read names, compiled once rather than per read.
+# pattern: m....../1123/ccs
+CCS_RE = re.compile(r"(.+)/(\d+)/ccs")
+# pattern: m...../1123 (alternative ccs)
+ALT_CCS_RE = re.compile(r"(.+)/(\d+)$")
+# pattern: m...../1123/23_450
+SUBREAD_RE = re.compile(r"(.+)/(\d+)/(\d+)_(\d+)")
+
 class PBRead(object):
     """Class for PacBio read."""
     def __init__(self, read):
@@ -46,18 +97,16 @@ class PBRead(object):
         self.start, self.end = None, None
         self.movie, self.zmw = None, None
 
-        #pattern: m....../1123/ccs
-        m = re.search(r"(.+)/(\d+)/ccs", self.name)
+        m = CCS_RE.match(self.name)
         if m is None:
-            #pattern: m...../1123 (alternative ccs)
-            m = re.search(r"(.+)/(\d+)$", self.name)
+            m = ALT_CCS_RE.match(self.name)
 
         if m is not None:
             self.isCCS = True
             self.movie, self.zmw = m.groups()[0], int(m.groups()[1])
             self.start, self.end = 0, len(self.sequence)
-        else: #pattern: m...../1123/23_450
-            m = re.search(r"(.+)/(\d+)/(\d+)_(\d+)", self.name)
+        else:
+            m = SUBREAD_RE.match(self.name)
             if m is not None:
                 self.movie = m.groups()[0]
                 self.zmw, self.start, self.end = \
@@ -67,6 +116,120 @@ class PBRead(object):
                                  format(r=self.name))
 
 
+# Sides of a read searched for primers: its front window and the reverse
+# complement of its back window.
+FRONT, BACK = 0, 1
+
+class PrimerHits(object):
+    """Best primer hits of front and back windows of reads, stored as
+    parallel arrays instead of a dict of DOMRecord objects per read.
+        sids: read id --> row
+        pids: primer id --> column
+        score, pStart, ..., sLen: fields of the best hits
+        best[side, row, column]: index of the best hit of primer 'column'
+            in 'side' of read 'row' in the field arrays, -1 if none.
+    """
+    FIELDS = ("score", "pStart", "pEnd", "pLen", "sStart", "sEnd", "sLen")
+
+    def __init__(self, sids, pids, sides, rows, cols, fields):
+        """sides, rows, cols, fields[name]: one item per hit.
+        Among hits of the same primer in the same side of a read, keeps
+        the first hit with the highest score.
+        """
+        self.sids, self.pids = sids, pids
+        # (primer indices, ids and columns of their F and R primers),
+        # see primerTable.
+        self._table = None
+        # (primer indices, best primer combos of all reads), see bestCombos.
+        self._combos = None
+        self.best = np.empty((2, len(sids), len(pids)), dtype=np.int64)
+        self.best.fill(-1)
+
+        # Flat index of each hit in self.best.
+        key = ((np.asarray(sides, dtype=np.int64) * len(sids) +
+                np.asarray(rows, dtype=np.int64)) * len(pids) +
+               np.asarray(cols, dtype=np.int64))
+        score = np.asarray(fields["score"], dtype=np.float64)
+        order = np.lexsort((np.arange(len(key)), -score, key))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = key[order][1:] != key[order][:-1]
+        keep = order[first]
+
+        self.best.flat[key[keep]] = np.arange(len(keep))
+        self.score = score[keep]
+        for name in self.FIELDS[1:]:
+            setattr(self, name,
+                    np.asarray(fields[name], dtype=np.int64)[keep])
+
+    def index(self, side, sid, pid):
+        """Return index of the best hit of primer 'pid' in 'side' of
+        read 'sid', or -1 if there is none."""
+        row, col = self.sids.get(sid), self.pids.get(pid)
+        if row is None or col is None:
+            return -1
+        return int(self.best[side, row, col])
+
+    def primerTable(self, primer_indices):
+        """Return ids of primers Fi and Ri, i in primer_indices, as a list
+        of (Fi, Ri), and columns of Fi and of Ri as two arrays, -1 for
+        primers without any hit. They are built once for all reads."""
+        if self._table is None or self._table[0] != primer_indices:
+            ids = [("F%d" % i, "R%d" % i) for i in primer_indices]
+            columns = tuple(np.array([self.pids.get(pid[d], -1)
+                                      for pid in ids], dtype=np.int64)
+                            for d in (0, 1))
+            self._table = (primer_indices, ids, columns)
+        return self._table[1], self._table[2]
+
+    def scores(self, side):
+        """Return scores of the best hits of all primers in 'side' of all
+        reads by row and column, 0 if there is none, followed by a column
+        of 0 which column -1 refers to."""
+        ret = np.zeros((len(self.sids), len(self.pids) + 1))
+        idx = self.best[side]
+        ret[:, :-1][idx >= 0] = self.score[idx[idx >= 0]]
+        return ret
+
+    def bestCombos(self, primer_indices):
+        """Return two arrays by row: i, index in primer_indices, and j,
+        strand ('+-'[j]) of the primer combo of which front & back hits
+        score the highest, computed for all reads at once."""
+        if self._combos is None or self._combos[0] != primer_indices:
+            _ids, (fcols, rcols) = self.primerTable(primer_indices)
+            front, back = self.scores(FRONT), self.scores(BACK)
+            # tally[:, 2*i], tally[:, 2*i+1]: score of primer_indices[i]
+            # on '+', '-'
+            tally = np.empty((len(self.sids), 2 * len(primer_indices)))
+            tally[:, 0::2] = front[:, fcols] + back[:, rcols]
+            tally[:, 1::2] = front[:, rcols] + back[:, fcols]
+            best = tally.argmax(axis=1)
+            self._combos = (primer_indices, (best // 2, best % 2))
+        return self._combos[1]
+
+    def record(self, side, sid, pid, min_score):
+        """Return DOMRecord of the best hit if its score >= min_score;
+        otherwise return None."""
+        i = self.index(side, sid, pid)
+        if i < 0 or self.score[i] < min_score:
+            return None
+        return DOMRecord(pid, sid, self.score[i],
+                         self.pStart[i], self.pEnd[i], self.pLen[i],
+                         self.sStart[i], self.sEnd[i], self.sLen[i])
+
+    def records(self, side):
+        """Return best hits of 'side' as {read_id: {primer_id: DOMRecord}},
+        the dicts _getBestFrontBackRecord used to return. Only a debugging
+        and test helper: it builds a DOMRecord per hit, which the pipeline
+        avoids by using bestCombos and record instead."""
+        ret = {}
+        for sid in self.sids:
+            for pid in self.pids:
+                r = self.record(side, sid, pid, float("-inf"))
+                if r is not None:
+                    ret.setdefault(sid, {})[pid] = r
+        return ret
+
+
 class ClassifierException(PBTranscriptException):
     """
     Exception class for Classifier.
@@ -87,10 +250,13 @@ class Classifier(object):
                  primer_report_fn=None, summary_fn=None,
                  cpus=1, change_read_id=True,
                  opts=ChimeraDetectionOptions(50, 10, 100, 50, 100),
-                 out_nfl_fn=None, out_flnc_fn=None, ignore_polyA=False):
+                 out_nfl_fn=None, out_flnc_fn=None, ignore_polyA=False,
+                 phmmer_threads=1):
         self.reads_fn = realpath(reads_fn)
         self.out_dir = realpath(out_dir)
         self.cpus = cpus
+        # Number of threads of each phmmer process.
+        self.phmmer_threads = phmmer_threads
         self.change_read_id = change_read_id
         self.chimera_detection_opts = opts
         self.ignore_polyA = ignore_polyA
@@ -128,12 +294,26 @@ class Classifier(object):
         self.out_front_back_dom_fn = op.join(self.out_dir, FRONTENDDOMFN)
         self.out_trimmed_reads_dom_fn = op.join(self.out_dir, CHIMERADOMFN)
 
-        self.chunked_front_back_reads_fns = None
+        # Number of reads in reads_fn, see numReads.
+        self._num_reads = None
+
         self.chunked_front_back_dom_fns = None
 
-        self.chunked_trimmed_reads_fns = None
         self.chunked_trimmed_reads_dom_fns = None
 
+        # Search primers in-process with pyhmmer if it is installed,
+        # otherwise call the phmmer executable on chunked reads.
+        self.use_pyhmmer = HAVE_PYHMMER
+        if HAVE_PYHMMER:
+            # Build the alphabet, background model and the builder of
+            # primer HMMs once, and share them among all searches.
+            self._alphabet = Alphabet.amino()
+            self._background = Background(self._alphabet)
+            self._builder = Builder(self._alphabet, popen=0.07, pextend=0.07,
+                                    score_matrix=PBMATRIXNAME)
+        # primer_fn --> DigitalSequenceBlock of primers, see _primerBlock.
+        self._primer_blocks = {}
+
         # The summary file: *.classify_summary.txt
         self.summary = ClassifySummary()
         self.summary_fn = summary_fn if summary_fn is not None else \
@@ -176,7 +356,7 @@ class Classifier(object):
     def _checkPhmmer(self):
         """Check phmmer can be called successfully."""
         logging.info("checking for phmmer existence.")
-        _output, errCode, errMsg = backticks("phmmer -h > /dev/null")
+        errCode, errMsg = self._execute(["phmmer", "-h"])
         if errCode != 0:
             raise ClassifierException("Unable to invoke phmmer.\n{e}".
                 format(e=errMsg))
@@ -209,10 +389,31 @@ class Classifier(object):
               >Ri_revcmp
               revcmp(Ri_sqeuence)
         4. return primers range(0, n)
+        Primers are not processed again if primer_out_fn was generated
+        from the same primer_fn content and arguments, as recorded in
+        primer_out_fn.json. Like primer_out_fn, the .json file is
+        kept in out_dir on purpose, so that runs resumed or repeated in
+        the same out_dir skip this step; it is not cleaned up.
         """
         logging.info("Process primers for {case}.".
                      format(case=("finding primers" if not revcmp_primers
                                   else "detecting chimeras")))
+        cache_fn = primer_out_fn + ".json"
+        with open(primer_fn, 'rb') as reader:
+            cache_key = hashlib.sha1(reader.read() + "\t{k}\t{r}".format(
+                k=window_size, r=revcmp_primers).encode()).hexdigest()
+        if op.exists(primer_out_fn) and op.exists(cache_fn):
+            try:
+                # Plain JSON, so a stale or foreign file can not run code.
+                with open(cache_fn) as reader:
+                    cache = json.load(reader)
+                if cache["key"] == cache_key:
+                    logging.info("Reuse primers in {f}.".
+                                 format(f=primer_out_fn))
+                    return [int(i) for i in cache["primer_indices"]]
+            except (IOError, ValueError, KeyError, TypeError):
+                logging.info("Ignore invalid {f}.".format(f=cache_fn))
+
         freader = FastaReader(primer_fn)
         primers = []
         primerComboId = -1
@@ -245,7 +446,13 @@ class Classifier(object):
                 revcmpF, revcmpR = revcmp(fwdF), revcmp(fwdR)
                 # If Fi and Ri are reverse complementariliy identical, bail out,
                 # because we need Poly A tail to distinguish Fi and Ri.
-                if fwdF.find(revcmpR) >= 0 or revcmpR.find(fwdF) >= 0:
+                # Only the shorter one can be found in the other one, which
+                # is a single comparison if they have the same length.
+                if len(fwdF) <= len(revcmpR):
+                    identical = fwdF in revcmpR
+                else:
+                    identical = revcmpR in fwdF
+                if identical:
                     infoMsg = "Primer F{n}, R{n} ".format(n=primerComboId) + \
                         "are reverse complementarily identical. " + \
                         "Need to add 'AAAA' to 3' to distinguish them."
@@ -279,147 +486,348 @@ class Classifier(object):
         for (name, seq) in primers:
             f.write(">{n}\n{s}\n".format(n=name, s=seq))
         f.close()
-        return range(0, primerComboId + 1)
+        # Primers loaded from an old primer_out_fn are outdated.
+        self._primer_blocks.pop(primer_out_fn, None)
+        primer_indices = list(range(0, primerComboId + 1))
+        with open(cache_fn, 'w') as writer:
+            json.dump({"key": cache_key, "primer_indices": primer_indices},
+                      writer)
+        return primer_indices
 
     @property
     def numReads(self):
-        """Return the number of reads in reads_fn."""
-        cmd = "grep -c '>' {r}".format(r=self.reads_fn)
-        output, errCode, errMsg = backticks(cmd)
-        if errCode != 0:
-            raise ClassifierException(
-                "Error reading file {r}:{e}".
-                format(r=self.reads_fn, e=str(errMsg)))
-        return int(output[0])
-
-    def _chunkReads(self, reads_fn, reads_per_chunk, chunked_reads_fns,
-            extract_front_back_only=True, window_size=100):
-        """Split reads within reads_fn into multiple chunks each containing
-        at most 'reads_per_chunk' reads, save to files in 'chunked_reads_fns'.
-        If extract_front_back_only is true, extract the first and the last
-        'window_size' bases and save them as readname_front and readname_back.
-        Otherwise, copy read names and sequences entirely.
-        """
-        logging.info("Split {f} into ".format(f=reads_fn) +
-                     "{n} chunks, ".format(n=len(chunked_reads_fns)) +
-                      "each containing at most {n} reads.".
-                      format(n=reads_per_chunk))
-        if extract_front_back_only:
-            logging.debug("Extract exactly {k} bases from front" +
-                          " and end of each read.".format(k=window_size))
-
-        freader = FastaReader(reads_fn)
-        chunkIndex = -1
-        fwriter = None
-        for i, read in enumerate(freader):
-            if i % reads_per_chunk == 0:
-                chunkIndex += 1
-                if fwriter is not None:
-                    fwriter.close()
-                    fwriter = None
-                fwriter = open(chunked_reads_fns[chunkIndex], 'w')
-            rcseq = revcmp(read.sequence)
-            if extract_front_back_only:
-                fwriter.write(">{n}_front\n{s}\n>{n}_back\n{rcs}\n".format(
-                              n=read.name, s=read.sequence[:window_size],
-                              rcs=rcseq[:window_size]))
-            else:
-                fwriter.write(">{n}\n{s}\n".format(n=read.name,
-                                                   s=read.sequence))
-
-        if fwriter is not None:
-            fwriter.close()
-
-
-    def _startPhmmers(self, chunked_reads_fns, chunkedDomFNs, outDomFN,
-            primer_fn, pbmatrix_fn):
-        """Run phmmers on chunked reads files in 'chunked_reads_fns' and
-        generate chunked dom files as listed in 'chunkedDomFNs', finally
-        concatenate dom files to 'outDomFN'."""
-        logging.info("Start to launch phmmer on chunked reads.")
-        jobs = []
-        for reads_fn, domFN in zip(chunked_reads_fns, chunkedDomFNs):
-            p = multiprocessing.Process(
-                target=self._phmmer,
-                args=(reads_fn, domFN, primer_fn, pbmatrix_fn))
-            jobs.append((p, domFN))
-            p.start()
-
-        for p, domFN in jobs:
-            p.join()
-            cmd = "cat {0} >> {1}".format(domFN, outDomFN)
-            _output, errCode, errMsg = backticks(cmd)
-            if errCode != 0:
+        """Return the number of reads in reads_fn, which is counted by
+        scanning reads_fn in large blocks once and then cached."""
+        if self._num_reads is None:
+            num_reads, last = 0, b"\n"
+            try:
+                with open(self.reads_fn, 'rb') as reader:
+                    for block in iter(lambda: reader.read(1 << 20), b""):
+                        # Count '>' at line starts, including one right
+                        # after a newline which ends the previous block.
+                        num_reads += block.count(b"\n>")
+                        if last == b"\n" and block[:1] == b">":
+                            num_reads += 1
+                        last = block[-1:]
+            except (IOError, OSError) as e:
                 raise ClassifierException(
-                    "Error concatenating dom files: {e}".
-                    format(e=str(errMsg)))
-
-    def _phmmer(self, reads_fn, domFN, primer_fn, pbmaxtrixFN):
-        """Invoke phmmer once."""
-        cmd = "phmmer --domtblout {d} --noali --domE 1 ".format(d=domFN) + \
-              "--mxfile {m} ".format(m=pbmaxtrixFN) + \
-              "--popen 0.07 --pextend 0.07 {r} {p} > /dev/null".\
-              format(r=reads_fn, p=primer_fn)
-        logging.debug("Calling phmmer: {cmd}".format(cmd=cmd))
-        _output, errCode, errMsg = backticks(cmd)
-        if (errCode != 0):
+                    "Error reading file {r}:{e}".
+                    format(r=self.reads_fn, e=str(e)))
+            self._num_reads = num_reads
+        return self._num_reads
+
+    @staticmethod
+    def _frontBackFasta(read, window_size):
+        """Return the first and the last 'window_size' bases of 'read' in
+        FASTA, named readname_front and readname_back."""
+        # Only reverse complement the last window_size bases.
+        return ">{n}_front\n{s}\n>{n}_back\n{rcs}\n".format(
+            n=read.name, s=read.sequence[:window_size],
+            rcs=revcmp(read.sequence[-window_size:]))
+
+    def _pipePhmmers(self, reads_fn, chunkedDomFNs, outDomFN, primer_fn,
+            pbmatrix_fn, extract_front_back_only=True, window_size=100):
+        """Pipe reads in 'reads_fn' to phmmers of phmmer_threads threads,
+        one per dom file listed in 'chunkedDomFNs'. Each read is
+        dealt to the phmmer with the fewest bases so far, so that all of
+        them are kept busy even though read lengths vary a lot.
+        If extract_front_back_only is true, only pipe the first and the
+        last 'window_size' bases as readname_front and readname_back.
+        Finally concatenate dom files to 'outDomFN'."""
+        logging.info("Start to pipe reads to phmmer.")
+        procs, errMsgs = [], []
+        devnull = open(os.devnull, 'w')
+        try:
+            for domFN in chunkedDomFNs:
+                cmd = self._phmmerCmd("-", domFN, primer_fn, pbmatrix_fn,
+                                      max(self.phmmer_threads, 1))
+                logging.debug("Calling phmmer: {cmd}".format(
+                              cmd=" ".join(cmd)))
+                errFile = tempfile.TemporaryFile(mode='w+')
+                procs.append((subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                               stdout=devnull, stderr=errFile,
+                                               bufsize=IO_BUFFER_SIZE,
+                                               universal_newlines=True),
+                              errFile))
+            # (bases piped, index) of phmmers, the least loaded first.
+            loads = [(0, k) for k in range(len(procs))]
+            for read in SimpleFastaReader(reads_fn):
+                record = self._frontBackFasta(read, window_size) \
+                    if extract_front_back_only else \
+                    ">{n}\n{s}\n".format(n=read.name, s=read.sequence)
+                bases, k = loads[0]
+                procs[k][0].stdin.write(record)
+                heapq.heapreplace(loads, (bases + len(record), k))
+        except (IOError, OSError) as e:
+            # phmmer is missing or exits early, whose stderr tells why.
+            errMsgs.append(str(e))
+        finally:
+            for proc, errFile in procs:
+                try:
+                    proc.stdin.close()
+                except (IOError, OSError):
+                    pass
+                if proc.wait() != 0:
+                    errFile.seek(0)
+                    errMsgs.append(errFile.read())
+                errFile.close()
+            devnull.close()
+
+        if len(errMsgs) > 0:
+            raise ClassifierException(
+                "Error calling phmmer: {e}.".format(e=" ".join(errMsgs)))
+
+        try:
+            append_files(src=chunkedDomFNs, dst=outDomFN)
+        except (IOError, OSError) as e:
             raise ClassifierException(
-                "Error calling phmmer: {e}.".format(e=str(errMsg)))
+                "Error concatenating dom files: {e}".format(e=str(e)))
+
+    def _numChunks(self, num_reads):
+        """Return number of chunks to split 'num_reads' reads into, one
+        phmmer of phmmer_threads threads for each, so that they use cpus
+        in total, with at least MIN_READS_PER_PHMMER reads in a chunk
+        unless there are fewer reads."""
+        max_chunks = max(self.cpus // max(self.phmmer_threads, 1), 1)
+        reads_per_chunk = max(int(math.ceil(num_reads / float(max_chunks))),
+                              MIN_READS_PER_PHMMER)
+        return max(int(math.ceil(num_reads / float(reads_per_chunk))), 1)
+
+    def _numThreads(self, num_chunks):
+        """Return number of worker threads to search 'num_chunks' chunks."""
+        return max(min(self.cpus, num_chunks), 1)
+
+    @staticmethod
+    def _phmmerCmd(reads_fn, domFN, primer_fn, pbmaxtrixFN, cpus=1):
+        """Return phmmer command searching primers in reads with 'cpus'
+        worker threads, reads are read in FASTA from stdin if 'reads_fn'
+        is '-'."""
+        cmd = ["phmmer", "--domtblout", domFN, "--noali", "--domE", "1",
+               "--mxfile", pbmaxtrixFN, "--popen", "0.07", "--pextend", "0.07",
+               "--cpu", str(cpus)]
+        if reads_fn == "-":
+            cmd += ["--qformat", "fasta"]
+        return cmd + [reads_fn, primer_fn]
+
+    @staticmethod
+    def _execute(cmd):
+        """Run command 'cmd', a list of program and arguments, without a
+        shell and discard its stdout. Return its exit code and stderr."""
+        try:
+            with open(os.devnull, 'w') as devnull:
+                proc = subprocess.Popen(cmd, stdout=devnull,
+                                        stderr=subprocess.PIPE,
+                                        universal_newlines=True)
+                _output, errMsg = proc.communicate()
+        except OSError as e:  # e.g., the program is not found.
+            return 1, str(e)
+        return proc.returncode, errMsg
+
+    def _buildFrontBackBlock(self, reads, window_size):
+        """Extract the first and the last 'window_size' bases of each read
+        in 'reads', reverse complement the last ones, and return them as a
+        DigitalSequenceBlock to search in-process. Both segments are named
+        by read names, front segments are at even indices and back
+        segments at odd indices of the block.
+        """
+        alphabet = self._alphabet
+        block = DigitalSequenceBlock(alphabet)
+        for read in reads:
+            # Only reverse complement the last window_size bases.
+            rcseq = revcmp(read.sequence[-window_size:])
+            block.append(TextSequence(
+                name=read.name,
+                sequence=read.sequence[:window_size]).digitize(alphabet))
+            block.append(TextSequence(
+                name=read.name,
+                sequence=rcseq).digitize(alphabet))
+        return block
+
+    def _readsBlock(self, reads_fn):
+        """Load all reads in 'reads_fn' to a DigitalSequenceBlock."""
+        with SequenceFile(reads_fn, digital=True,
+                          alphabet=self._alphabet) as reader:
+            return reader.read_block()
+
+    def _primerBlock(self, primer_fn):
+        """Return primers in 'primer_fn' as a DigitalSequenceBlock, which
+        is loaded once and reused by searches of all batches of reads."""
+        if primer_fn not in self._primer_blocks:
+            with SequenceFile(primer_fn, digital=True,
+                              alphabet=self._alphabet) as reader:
+                self._primer_blocks[primer_fn] = reader.read_block()
+        return self._primer_blocks[primer_fn]
+
+    def _trimmedReadsBlock(self, fl_reads):
+        """Load trimmed full-length reads, (annotation, sequence) pairs,
+        to a DigitalSequenceBlock named by read ids, as phmmer names reads
+        in a trimmed reads file."""
+        alphabet = self._alphabet
+        block = DigitalSequenceBlock(alphabet)
+        for annotation, seq in fl_reads:
+            block.append(TextSequence(name=annotation.ID,
+                                      sequence=seq).digitize(alphabet))
+        return block
+
+    @staticmethod
+    def _batches(reads):
+        """Split 'reads' into lists of at most READS_PER_BATCH reads."""
+        batch = []
+        for read in reads:
+            batch.append(read)
+            if len(batch) == READS_PER_BATCH:
+                yield batch
+                batch = []
+        if len(batch) > 0:
+            yield batch
+
+    def _iterFrontBackHits(self, reads, window_size):
+        """Split 'reads' into batches of READS_PER_BATCH reads, and yield
+        each batch along with (side, DOMRecord) of primer hits in front &
+        back segments of its reads, searched in-process. Segments are
+        extracted one batch at a time, so only one batch of segments is
+        kept in memory."""
+        for batch in self._batches(reads):
+            yield batch, self._phmmerFrontBack(
+                self._buildFrontBackBlock(batch, window_size),
+                self.primer_front_back_fn)
+
+    def _iterReadsWithHits(self, reads, window_size):
+        """Yield each batch of 'reads' along with PrimerHits of its reads,
+        see _iterFrontBackHits."""
+        for batch, records in self._iterFrontBackHits(reads, window_size):
+            yield batch, self._getBestFrontBackRecord(records)
+
+    def _searchFrontBack(self, reads_fn, window_size):
+        """Search primers in front & back segments of reads in 'reads_fn'
+        in-process, and yield (side, DOMRecord) for each hit, see
+        _iterFrontBackHits."""
+        with SimpleFastaReader(reads_fn) as reader:
+            for _batch, records in self._iterFrontBackHits(reader,
+                                                           window_size):
+                for side_record in records:
+                    yield side_record
+
+    def _phmmerInProcess(self, reads, primer_fn):
+        """Search primers in 'primer_fn' against reads in DigitalSequenceBlock
+        'reads' using pyhmmer, and yield (index of read in reads, DOMRecord)
+        for each reported domain hit, the same as parsing phmmer DOM output.
+        """
+        logging.debug("Start to search primers in-process using pyhmmer.")
+        primers = self._primerBlock(primer_fn)
+        # Reads are queries and primers are targets, as in _phmmer.
+        # A single search spreads queries over worker threads, and
+        # yields TopHits in the order of queries.
+        all_hits = phmmer(reads, primers,
+                          cpus=self._numThreads(len(reads)),
+                          builder=self._builder,
+                          background=self._background, domE=1)
+        for r in self._recordsFromHits(all_hits):
+            yield r
+
+    def _phmmerFrontBack(self, front_back_block, primer_fn):
+        """Search primers in 'primer_fn' against front & back segments
+        of reads made by _buildFrontBackBlock, and yield (side, DOMRecord)
+        for each reported domain hit. The side of a hit is known from the
+        index of its segment, so segments need no _front/_back suffix."""
+        for i, r in self._phmmerInProcess(front_back_block, primer_fn):
+            yield (FRONT, BACK)[i % 2], r
+
+    @staticmethod
+    def _recordsFromHits(all_hits, start=0):
+        """Convert pyhmmer TopHits of reads start, start + 1, ... to
+        (read index, DOMRecord) of each reported domain hit, fields are
+        the same as what DOMRecord.fromString reads from a DOM line."""
+        for i, hits in enumerate(all_hits, start):
+            sid, sLen = hits.query.name, len(hits.query)
+            for hit in hits.reported:
+                for domain in hit.domains.reported:
+                    ali = domain.alignment
+                    yield i, DOMRecord(pid=hit.name, sid=sid,
+                                       score=domain.score,
+                                       pStart=ali.target_from - 1,
+                                       pEnd=ali.target_to, pLen=hit.length,
+                                       sStart=ali.hmm_from - 1,
+                                       sEnd=ali.hmm_to, sLen=sLen)
 
     def _getBestFrontBackRecord(self, domFN):
-        """Parses DOM output from phmmer and fill in best_of_front, best_of_back
-           bestOf: sequence id ---> DOMRecord
+        """Parses DOM output from phmmer and returns PrimerHits holding
+           the best hit of each primer in the front & back of each read.
+           domFN can either be a DOM file or (side, DOMRecord) pairs of
+           in-process search.
         """
         logging.info("Get the best front & back primer hits.")
-        #bestOf_ = {} # key: sid --> primer name --> DOMRecord
-        best_of_front = defaultdict(lambda:None)
-        best_of_back = defaultdict(lambda:None)
+        sids, pids = {}, {}  # read id --> row, primer id --> column
+        sides, rows, cols = [], [], []
+        fields = dict((name, []) for name in PrimerHits.FIELDS)
 
-        reader = DOMReader(domFN)
-        for r in reader:
+        reader = self._readFrontBackDOM(domFN) if isinstance(domFN, str) \
+                 else domFN
+        for side, r in reader:
             # allow missing adapter
             if r.sStart > 48 or r.pStart > 48:
                 continue
 
+            sides.append(side)
+            rows.append(sids.setdefault(r.sid, len(sids)))
+            cols.append(pids.setdefault(r.pid, len(pids)))
+            for name in PrimerHits.FIELDS:
+                fields[name].append(getattr(r, name))
+        return PrimerHits(sids, pids, sides, rows, cols, fields)
+
+
+    @staticmethod
+    def _readDOM(domFN):
+        """Yield DOMRecords in DOM file 'domFN', which is read through
+        a large buffer one line at a time."""
+        with DOMReader(open(domFN, 'r', IO_BUFFER_SIZE)) as reader:
+            for r in reader:
+                yield r
+
+    def _readFrontBackDOM(self, domFN):
+        """Yield (side, DOMRecord) of hits in phmmer DOM output of front
+        & back segments of reads, with _front/_back removed from sids."""
+        for r in self._readDOM(domFN):
             if r.sid.endswith('_front'):# _front
-                bestOf = best_of_front
-                r.sid = r.sid[:-6]
+                side, r.sid = FRONT, r.sid[:-6]
             elif r.sid.endswith('_back'):# _back
-                bestOf = best_of_back
-                r.sid = r.sid[:-5]
+                side, r.sid = BACK, r.sid[:-5]
             else:
                 raise ClassifierException(
                     "Unable to parse a read {r} in phmmer dom file {f}.".
                     format(r=r.sid, f=domFN))
-            if r.sid not in bestOf:
-                bestOf[r.sid] = {}
-            if (r.pid in bestOf[r.sid] and
-                bestOf[r.sid][r.pid].score < r.score) or \
-               (r.pid not in bestOf[r.sid]):
-                bestOf[r.sid][r.pid] = r
-        return (best_of_front, best_of_back)
-
+            yield side, r
 
     def _getChimeraRecord(self, domFN, opts):
         """Parses phmmer DOM output from trimmed reads for chimera
-           detection, return DOMRecord of suspicious chimeras, which
-           have primer hits in the MIDDLE of the sequence.
+           detection, return a sorted array of ids of suspicious chimeras,
+           which have primer hits in the MIDDLE of the sequence.
+           domFN can either be a DOM file or DOMRecords of in-process search.
         """
         logging.info("Identify chimera records.")
-        # sid --> list of DOMRecord with primer hits in the middle
-        # of sequence.
-        suspicous_hits = defaultdict(lambda:[])
-        reader = DOMReader(domFN)
+        # sids of reads with primer hits in the middle of sequence.
+        sids = []
+        reader = self._readDOM(domFN) if isinstance(domFN, str) else domFN
         for r in reader:
             # A hit has to be in the middle of sequence, and with
             # decent score.
             if r.sStart > opts.min_dist_from_end and \
                r.sEnd < r.sLen - opts.min_dist_from_end and \
                r.score > opts.min_score:
-                suspicous_hits[r.sid].append(r)
-        return suspicous_hits
-
-    def _updateChimeraInfo(self, suspicous_hits, in_read_fn, out_flnc_fn,
+                sids.append(r.sid)
+        return np.unique(np.array(sids, dtype=str))
+
+    @staticmethod
+    def _isChimera(ids, chimera_ids):
+        """Return a boolean array of whether each of 'ids' is in the
+        sorted array 'chimera_ids'."""
+        ids = np.array(ids, dtype=str)
+        if len(chimera_ids) == 0:
+            return np.zeros(len(ids), dtype=bool)
+        i = np.searchsorted(chimera_ids, ids)
+        return chimera_ids[np.minimum(i, len(chimera_ids) - 1)] == ids
+
+    def _updateChimeraInfo(self, chimera_ids, in_read_fn, out_flnc_fn,
                            out_flc_fn, primer_report_fl_fn):
         """
         in_read_fn --- a fasta of full-length reads
@@ -430,31 +838,47 @@ class Classifier(object):
         logging.info("Update chimera info to reads annotations " +
                      "in the output FASTA file and the primer report.")
 
-        with FastaReader(in_read_fn) as reader, \
-             FastaWriter(out_flnc_fn) as writer, \
-             FastaWriter(out_flc_fn) as writer_chimera, \
-             open(primer_report_fl_fn, 'w') as reporter:
+        with SimpleFastaReader(in_read_fn) as reader, \
+             BatchWriter(out_flnc_fn) as writer, \
+             BatchWriter(out_flc_fn) as writer_chimera, \
+             BatchWriter(primer_report_fl_fn) as reporter:
             reporter.write("\t".join(ReadAnnotation.fieldsNames()) + "\n")
-            for r in reader:
-                # e.g. r.name="movie/zmw/0_100_CCS fiveend=1;threeend=100;"
-                readid = r.name.split()[0]
-                annotation = ReadAnnotation.fromString(r.name, ignore_polyA=self.ignore_polyA)
-                if readid not in suspicous_hits:  # Non-chimeric reads
+            # e.g. r.name="movie/zmw/0_100_CCS fiveend=1;threeend=100;"
+            fl_reads = ((ReadAnnotation.fromString(
+                            r.name, ignore_polyA=self.ignore_polyA),
+                         r.sequence) for r in reader)
+            self._writeChimeraInfo(chimera_ids, fl_reads,
+                                   writer, writer_chimera, reporter)
+
+    def _writeChimeraInfo(self, chimera_ids, fl_reads, writer,
+                          writer_chimera, reporter):
+        """
+        chimera_ids --- sorted array of ids of chimeric reads
+        fl_reads --- (annotation, sequence) of full-length reads
+        Mark each read in fl_reads chimeric or not, write it to writer
+        (non-chimeric) or writer_chimera (chimeric), and write its
+        annotation to reporter.
+        """
+        for batch in self._batches(fl_reads):
+            is_chimera = self._isChimera([a.ID for a, _seq in batch],
+                                         chimera_ids)
+            for (annotation, seq), chimeric in zip(batch, is_chimera):
+                if not chimeric:  # Non-chimeric reads
                     # Primer of a primer-trimmed read can not be None.
                     # assert(annotation.primer is not None)
                     annotation.chimera = 0
                     assert(annotation.isFullLength)
                     self.summary.num_flnc += 1
-                    self.summary.num_flnc_bases += len(r.sequence)
-                    writer.writeRecord(annotation.toAnnotation(),
-                                       r.sequence)
+                    self.summary.num_flnc_bases += len(seq)
+                    writer.write(">", annotation.toAnnotation(), "\n",
+                                 seq, "\n")
                 else:  # chimeric reads
                     annotation.chimera = 1
                     self.summary.num_flc += 1
-                    writer_chimera.writeRecord(annotation.toAnnotation(),
-                                               r.sequence)
+                    writer_chimera.write(">", annotation.toAnnotation(), "\n",
+                                         seq, "\n")
 
-                reporter.write(annotation.toReportRecord() + "\n")
+                reporter.write(annotation.toReportRecord(), "\n")
 
 
     def _findPolyA(self, seq, min_a_num=8, three_start=None):
@@ -470,69 +894,76 @@ class Classifier(object):
         # search within the last <offset> bp
         i = seq.rfind(polyA, startEnd)
         if i > 0:
-            nonA = 0
-            # backtrace to the front of polyA, allowing only 2 max non-A
-            while i >= 0:
-                nonA += (seq[i] != 'A')
-                if nonA > 2:
-                    break
-                i -= 1
-            return i+1
+            # backtrace to the front of polyA, allowing only 2 max non-A,
+            # by locating the 3rd non-A base left of i.
+            if polyA_start is not None:
+                return polyA_start(seq, i, 2)
+            # Without BioReaders, search it within growing windows of
+            # seq[:i+1].
+            window = 64
+            while True:
+                start = max(i + 1 - window, 0)
+                bases = np.frombuffer(seq[start:i+1].encode('ascii'),
+                                      dtype=np.uint8)
+                nonA = np.flatnonzero(bases != ord('A'))
+                if len(nonA) > 2:
+                    return start + int(nonA[-3]) + 1
+                if start == 0:
+                    return 0
+                window *= 4
         else:
             return -1
 
-    def _pickBestPrimerCombo(self, dFront, dBack, primer_indices, min_score):
-        """Pick up best primer combo.
+    @staticmethod
+    def _trimRange(seq_len, five_end, three_start, polyAPos, s, e, strand):
+        """Return (start, end, s1, e1), where seq[start:end] is what remains
+        of a strand-oriented read of length seq_len, which is read [s, e),
+        after trimming its 5' primer, polyA tail or 3' primer, and s1, e1
+        are read coordinates of the remaining sequence.
+        """
+        start = five_end if five_end is not None else 0
+        if polyAPos >= 0: # polyA found
+            end = polyAPos
+        elif three_start is not None: # polyA not found
+            end = three_start
+        else: # keep the 3' end, which may not be s + seq_len.
+            return (start, seq_len, s + start, e) if strand == "+" else \
+                   (start, seq_len, e - start, s)
+        if strand == "+":
+            return start, end, s + start, s + end
+        else:
+            return start, end, e - start, e - end
 
-        best_of_front/Back: {read_id: {primer_name:DOMRecord}}
+    def _pickBestPrimerCombo(self, primer_hits, sid, primer_indices,
+                             min_score):
+        """Pick up best primer combo of read 'sid'.
+
+        primer_hits: PrimerHits of best front & back hits of all reads
         If the read is '+' strand: then front -> F0, back -> R0
         else: front -> R0, back -> F0
         Returns: primer index, left_DOMRecord or None, right_DOMRecord or None
         """
-        def getDomRecord(d, k, min_score):
-            """d: {k:DomRecord}
-            Return DomRecord if d[k].score > min_score; otherwise return None.
-            """
-            if d is not None and k in d and d[k].score >= min_score:
-                return d[k]
-            else:
-                return None
-        logging.debug("dFront={0}".format(dFront))
-        logging.debug("dBack={0}".format(dBack))
-        tally = {}
-        for ind in primer_indices:
-            fpid, rpid = 'F' + str(ind), 'R' + str(ind)
-            tally[(ind, '+')] = 0
-            if dFront is not None and fpid in dFront:
-                tally[(ind, '+')] += dFront[fpid].score
-            if dBack is not None and rpid in dBack:
-                tally[(ind, '+')] += dBack[rpid].score
-            tally[(ind, '-')] = 0
-            if dFront is not None and rpid in dFront:
-                tally[(ind, '-')] += dFront[rpid].score
-            if dBack is not None and fpid in dBack:
-                tally[(ind, '-')] += dBack[fpid].score
-
-        bestInd, bestStrand, bestScore = (None, None, -1000)
-        for idStrand, s in tally.iteritems():
-            if bestScore <= s:
-                bestScore = s
-                bestInd, bestStrand = idStrand
-
-        k1 = 'F' + str(bestInd)
-        k2 = 'R' + str(bestInd)
+        primer_ids, _columns = primer_hits.primerTable(primer_indices)
+        row = primer_hits.sids.get(sid)
+        if row is None:  # No hits, all combos score 0.
+            i, j = 0, 0
+        else:
+            best_i, best_j = primer_hits.bestCombos(primer_indices)
+            i, j = int(best_i[row]), int(best_j[row])
+        bestInd, bestStrand = primer_indices[i], "+-"[j]
+
+        k1, k2 = primer_ids[i]
         if bestStrand == '+':
             return (bestInd, bestStrand,
-                    getDomRecord(dFront, k1, min_score),
-                    getDomRecord(dBack, k2, min_score))
+                    primer_hits.record(FRONT, sid, k1, min_score),
+                    primer_hits.record(BACK, sid, k2, min_score))
         else:
             return (bestInd, bestStrand,
-                    getDomRecord(dBack, k1, min_score),
-                    getDomRecord(dFront, k2, min_score))
+                    primer_hits.record(BACK, sid, k1, min_score),
+                    primer_hits.record(FRONT, sid, k2, min_score))
 
     def _trimBarCode(self, reads_fn, out_fl_reads_fn, out_nfl_reads_fn,
-            primer_report_nfl_fn,
-            best_of_front, best_of_back, primer_indices,
+            primer_report_nfl_fn, primer_hits, primer_indices,
             min_seq_len, min_score, change_read_id, ignore_polyA):
         """Trim bar code from reads in 'reads_fn', annotate each read,
         indicating:
@@ -549,7 +980,7 @@ class Classifier(object):
         and will write primer info for fl reads when chimera detection
         is done.
 
-        best_of_front/Back: {read_id: {primer_name:DOMRecord}}
+        primer_hits: PrimerHits of best front & back hits of reads.
         min_seq_len: minimum length to output a read.
         min_score: minimum score to output a read.
         change_read_id: if True, change read ids to 'movie/zmw/start_end'.
@@ -562,95 +993,111 @@ class Classifier(object):
         logging.debug("Writing primer reports before chimera detection to {f}".
                       format(f=primer_report_nfl_fn))
 
-        with FastaReader(reads_fn) as fareader, \
-             FastaWriter(out_nfl_reads_fn) as nfl_fawriter, \
-             FastaWriter(out_fl_reads_fn) as fl_fawriter, \
-             open(primer_report_nfl_fn, 'w') as reporter:
-            for read in fareader:
-                self.summary.num_reads += 1  # number of ROI reads
-                pbread = PBRead(read)
-                logging.debug("Pick up best primer combo for {r}".
-                              format(r=read.name))
-                primerIndex, strand, fw, rc = self._pickBestPrimerCombo(
-                    best_of_front[read.name], best_of_back[read.name],
-                    primer_indices, min_score)
+        with SimpleFastaReader(reads_fn) as fareader, \
+             BatchWriter(out_nfl_reads_fn) as nfl_fawriter, \
+             BatchWriter(out_fl_reads_fn) as fl_fawriter, \
+             BatchWriter(primer_report_nfl_fn) as reporter:
+            for annotation, seq in self._trimReads(
+                    fareader, primer_hits, primer_indices, min_seq_len,
+                    min_score, change_read_id, ignore_polyA,
+                    nfl_fawriter, reporter):
+                # Write long full-length reads
+                fl_fawriter.write(">", annotation.toAnnotation(), "\n",
+                                  seq, "\n")
+
+    @staticmethod
+    def _newReadId(change_read_id):
+        """Return a function (pbread, s1, e1) --> id of the trimmed read,
+        which is 'movie/zmw/s1_e1' if change_read_id is True, otherwise
+        the original read name."""
+        if not change_read_id:
+            return lambda pbread, s1, e1: pbread.name
+
+        def newReadId(pbread, s1, e1):
+            """Return 'movie/zmw/s1_e1', suffixed by '_CCS' for CCS."""
+            return "%s/%s/%s_%s%s" % (pbread.movie, pbread.zmw, s1, e1,
+                                      "_CCS" if pbread.isCCS else "")
+        return newReadId
+
+    def _trimReads(self, reads, primer_hits, primer_indices, min_seq_len,
+                   min_score, change_read_id, ignore_polyA,
+                   nfl_fawriter, reporter):
+        """Trim bar code from 'reads' as _trimBarCode does, write long
+        non-full-length reads to 'nfl_fawriter', write primer info of
+        non-full-length reads to 'reporter', and yield (annotation,
+        trimmed sequence) of long full-length reads.
+        """
+        # Decide once how to name reads and whether to log each read.
+        newReadId = self._newReadId(change_read_id)
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        for read in reads:
+            self.summary.num_reads += 1  # number of ROI reads
+            pbread = PBRead(read)
+            primerIndex, strand, fw, rc = self._pickBestPrimerCombo(
+                primer_hits, read.name, primer_indices, min_score)
+            if debug:
                 logging.debug("read={0}\n".format(read.name) +
                         "primer={0} strand={1} fw={2} rc={3}".
                         format(primerIndex, strand, fw, rc))
 
-                if fw is None and rc is None:
-                    # No primer seen in this sequence, classified
-                    # as non-full-length
-                    newName = pbread.name
-                    if change_read_id:
-                        newName = "{m}/{z}/{s1}_{e1}{isccs}".format(
-                                  m=pbread.movie, z=pbread.zmw,
-                                  s1=pbread.start, e1=pbread.end,
-                                  isccs=("_CCS" if pbread.isCCS else ""))
-                    annotation = ReadAnnotation(ID=newName)
-                    # Write reports of nfl reads
-                    reporter.write(annotation.toReportRecord() + "\n")
-                    if len(read.sequence) >= min_seq_len:
-                        # output non-full-length reads to nfl.trimmed.fasta
-                        nfl_fawriter.writeRecord(annotation.toAnnotation(),
-                                                 read.sequence)
-                        self.summary.num_nfl += 1
-                    else:
-                        self.summary.num_filtered_short_reads += 1
-                    continue
-                seq = read.sequence if strand == "+" else revcmp(read.sequence)
-                five_end, three_start = None, None
-                if fw is not None:
-                    five_end = fw.sEnd
-                    self.summary.num_5_seen += 1
-                if rc is not None:
-                    three_start = len(seq) - rc.sEnd
-                    self.summary.num_3_seen += 1
-
-                s, e = pbread.start, pbread.end
-                # Try to find polyA tail in read
-                polyAPos = self._findPolyA(seq, three_start=three_start)
-                if polyAPos >= 0: # polyA found
-                    seq = seq[:polyAPos]
-                    e1 = s + polyAPos if strand == "+" else e - polyAPos
-                    self.summary.num_polyA_seen += 1
-                elif three_start is not None: # polyA not found
-                    seq = seq[:three_start]
-                    e1 = s + three_start if strand == "+" else e - three_start
-                else:
-                    e1 = e if strand == "+" else s
-
-                if five_end is not None:
-                    seq = seq[five_end:]
-                    s1 = s + five_end if strand == "+" else e - five_end
-                else:
-                    s1 = s if strand == "+" else e
-
-                newName = pbread.name
-                if change_read_id:
-                    newName = "{m}/{z}/{s1}_{e1}{isccs}".format(
-                        m=pbread.movie, z=pbread.zmw, s1=s1, e1=e1,
-                        isccs=("_CCS" if pbread.isCCS else ""))
-                # Create an annotation
-                annotation = ReadAnnotation(ID=newName, strand=strand,
-                    fiveend=five_end, polyAend=polyAPos,
-                    threeend=three_start, primer=primerIndex, ignore_polyA=ignore_polyA)
-
-                # Write reports for nfl reads
-                if annotation.isFullLength is not True:
-                    reporter.write(annotation.toReportRecord() + "\n")
-
-                if len(seq) >= min_seq_len:
-                    if annotation.isFullLength is True:
-                        # Write long full-length reads
-                        fl_fawriter.writeRecord(annotation.toAnnotation(), seq)
-                        self.summary.num_fl += 1
-                    else:
-                        # Write long non-full-length reads.
-                        nfl_fawriter.writeRecord(annotation.toAnnotation(), seq)
-                        self.summary.num_nfl += 1
+            if fw is None and rc is None:
+                # No primer seen in this sequence, classified
+                # as non-full-length
+                annotation = ReadAnnotation(
+                    ID=newReadId(pbread, pbread.start, pbread.end))
+                # Write reports of nfl reads
+                reporter.write(annotation.toReportRecord(), "\n")
+                if len(read.sequence) >= min_seq_len:
+                    # output non-full-length reads to nfl.trimmed.fasta
+                    nfl_fawriter.write(">", annotation.toAnnotation(), "\n",
+                                       read.sequence, "\n")
+                    self.summary.num_nfl += 1
                 else:
                     self.summary.num_filtered_short_reads += 1
+                continue
+            seq = read.sequence if strand == "+" else revcmp(read.sequence)
+            five_end, three_start = None, None
+            if fw is not None:
+                five_end = fw.sEnd
+                self.summary.num_5_seen += 1
+            if rc is not None:
+                three_start = len(seq) - rc.sEnd
+                self.summary.num_3_seen += 1
+
+            # Try to find polyA tail in read
+            polyAPos = self._findPolyA(seq, three_start=three_start)
+            if polyAPos >= 0: # polyA found
+                self.summary.num_polyA_seen += 1
+
+            # Trim primers and polyA with a single slice.
+            start, end, s1, e1 = self._trimRange(
+                len(seq), five_end, three_start, polyAPos,
+                pbread.start, pbread.end, strand)
+            seq = seq[start:end]
+
+            # Create an annotation
+            annotation = ReadAnnotation(ID=newReadId(pbread, s1, e1),
+                strand=strand, fiveend=five_end, polyAend=polyAPos,
+                threeend=three_start, primer=primerIndex,
+                ignore_polyA=ignore_polyA)
+
+            # Write reports for nfl reads
+            isFullLength = annotation.isFullLength
+            if isFullLength is not True:
+                reporter.write(annotation.toReportRecord(), "\n")
+
+            if len(seq) >= min_seq_len:
+                if isFullLength is True:
+                    # Yield long full-length reads
+                    self.summary.num_fl += 1
+                    yield annotation, seq
+                else:
+                    # Write long non-full-length reads.
+                    nfl_fawriter.write(">", annotation.toAnnotation(), "\n",
+                                       seq, "\n")
+                    self.summary.num_nfl += 1
+            else:
+                self.summary.num_filtered_short_reads += 1
 
     def _validateOutputs(self, out_dir, out_all_reads_fn):
         """Validate and create output directory."""
@@ -669,8 +1116,12 @@ class Classifier(object):
         """Remove files in the list if they exist."""
         logging.debug("Clean up intermediate files.")
         for f in fileList:
-            if op.exists(f):
+            # Remove f directly, most files to clean up do exist.
+            try:
                 os.remove(f)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
 
     def runPrimerTrimmer(self):
         """Run PHMMER to identify barcodes and trim them away.
@@ -688,54 +1139,45 @@ class Classifier(object):
             primer_out_fn=self.primer_front_back_fn,
             revcmp_primers=False)
 
-        need_cleanup = True
+        need_cleanup = False
+        dom_records = self.out_front_back_dom_fn
+        window_size = self.chimera_detection_opts.primer_search_window
         if os.path.exists(self.out_front_back_dom_fn):
             logging.info("Output already exists. Parsing {0}".format(self.out_front_back_dom_fn))
-            need_cleanup = False
+        elif self.use_pyhmmer:
+            # Extract only the front and the end segment from each read,
+            # and search primers in them without writing chunked files.
+            dom_records = self._searchFrontBack(self.reads_fn, window_size)
         else:
+            need_cleanup = True
             # Split reads in reads_fn into smaller chunks.
-            num_chunks = max(min(self.cpus, self.numReads), 1)
-            reads_per_chunk = int(math.ceil(self.numReads/(float(num_chunks))))
-            num_chunks = int(math.ceil(self.numReads/float(reads_per_chunk)))
+            num_chunks = self._numChunks(self.numReads)
     
             logging.debug("Split all reads into {n} chunks".format(n=num_chunks))
     
-            # Divide input reads into smaller chunks and extract only
-            # the front and the end segment from each read.
-            self.chunked_front_back_reads_fns = generateChunkedFN(self.out_dir,
-                "in.front_end.fa_split", num_chunks)
-    
-            # Dom output of phmmer for the above front/end sequences.
+            # Dom output of phmmer for front/end sequences of each chunk.
             self.chunked_front_back_dom_fns = generateChunkedFN(self.out_dir,
                 "out.front_end.hmmer_split", num_chunks)
     
-            # Split reads within 'reads_fn' into 'num_chunks' chunks, and only
-            # extract the front and end segment from each read.
-            window_size = self.chimera_detection_opts.primer_search_window
-            self._chunkReads(reads_fn=self.reads_fn,
-                             reads_per_chunk=reads_per_chunk,
-                             chunked_reads_fns=self.chunked_front_back_reads_fns,
-                             extract_front_back_only=True,
-                             window_size=window_size)
-    
-            # Start n='num_chunks' phmmer.
-            self._startPhmmers(self.chunked_front_back_reads_fns,
-                               self.chunked_front_back_dom_fns,
-                               self.out_front_back_dom_fn,
-                               self.primer_front_back_fn,
-                               self.pbmatrix_fn)
-
-        # Parse dome file, and return dictionary of front & back.
-        best_of_front, best_of_back = self._getBestFrontBackRecord(
-                self.out_front_back_dom_fn)
+            # Start n='num_chunks' phmmer, and pipe the front and end
+            # segment of each read to them.
+            self._pipePhmmers(reads_fn=self.reads_fn,
+                              chunkedDomFNs=self.chunked_front_back_dom_fns,
+                              outDomFN=self.out_front_back_dom_fn,
+                              primer_fn=self.primer_front_back_fn,
+                              pbmatrix_fn=self.pbmatrix_fn,
+                              extract_front_back_only=True,
+                              window_size=window_size)
+
+        # Parse dome file, and return best hits of front & back.
+        primer_hits = self._getBestFrontBackRecord(dom_records)
 
         # Trim bar code away
         self._trimBarCode(reads_fn=self.reads_fn,
                           out_fl_reads_fn=self._trimmed_fl_reads_fn,
                           out_nfl_reads_fn=self.out_nfl_fn,
                           primer_report_nfl_fn=self._primer_report_nfl_fn,
-                          best_of_front=best_of_front,
-                          best_of_back=best_of_back,
+                          primer_hits=primer_hits,
                           primer_indices=primer_indices,
                           min_seq_len=self.chimera_detection_opts.min_seq_len,
                           min_score=self.chimera_detection_opts.min_score,
@@ -743,18 +1185,17 @@ class Classifier(object):
                           ignore_polyA=self.ignore_polyA)
 
         if need_cleanup:
-            # Clean intemediate files: chunked reads files and chunked dom files.
-            self._cleanup(self.chunked_front_back_reads_fns +
-                          self.chunked_front_back_dom_fns)
+            # Clean intemediate files: chunked dom files.
+            self._cleanup(self.chunked_front_back_dom_fns)
         logging.info("Done with finding and trimming primers and polyAs.")
 
     def runChimeraDetector(self):
         """Detect chimeras from trimmed reads."""
         logging.info("Start to detect chimeras from trimmed reads.")
-        need_cleanup = True
+        need_cleanup = False
+        dom_records = self.out_trimmed_reads_dom_fn
         if os.path.exists(self.out_trimmed_reads_dom_fn):
             logging.info("Output already exists. Parsing {0}.".format(self.out_trimmed_reads_dom_fn))
-            need_cleanup = False
         else:
             # Create forward/reverse primers for chimera detection.
             _primer_indices = self._processPrimers(
@@ -762,41 +1203,48 @@ class Classifier(object):
                 window_size=self.chimera_detection_opts.primer_search_window,
                 primer_out_fn=self.primer_chimera_fn,
                 revcmp_primers=True)
-    
-            num_chunks = max(min(self.summary.num_fl, self.cpus), 1)
-            #logging.debug("Split non-full-length reads into {n} chunks.".
-            #              format(n=num_chunks))
-            # Only detect chimeras on full-length reads in order to save time
-            reads_per_chunk = int(math.ceil(self.summary.num_fl /
-                                            (float(num_chunks))))
-            num_chunks = int(math.ceil(self.summary.num_fl/float(reads_per_chunk)))
-    
-            self.chunked_trimmed_reads_fns = generateChunkedFN(self.out_dir,
-                "in.trimmed.fa_split", num_chunks)
-    
-            self.chunked_trimmed_reads_dom_fns = generateChunkedFN(self.out_dir,
-                "out.trimmed.hmmer_split", num_chunks)
-    
-            self._chunkReads(reads_fn=self._trimmed_fl_reads_fn,
-                             reads_per_chunk=reads_per_chunk,
-                             chunked_reads_fns=self.chunked_trimmed_reads_fns,
-                             extract_front_back_only=False)
-    
-            self._startPhmmers(self.chunked_trimmed_reads_fns,
-                               self.chunked_trimmed_reads_dom_fns,
-                               self.out_trimmed_reads_dom_fn,
-                               self.primer_chimera_fn,
-                               self.pbmatrix_fn)
 
-        suspicous_hits = self._getChimeraRecord(self.out_trimmed_reads_dom_fn,
-                                                self.chimera_detection_opts)
+            if self.use_pyhmmer:
+                # Search primers in trimmed reads without chunking them.
+                dom_records = (r for _i, r in self._phmmerInProcess(
+                    self._readsBlock(self._trimmed_fl_reads_fn),
+                    self.primer_chimera_fn))
+            else:
+                need_cleanup = True
+                # Only detect chimeras on full-length reads in order to save time
+                num_chunks = self._numChunks(self.summary.num_fl)
+                logging.debug("Split full-length reads into {n} chunks.".
+                              format(n=num_chunks))
+
+                self.chunked_trimmed_reads_dom_fns = generateChunkedFN(self.out_dir,
+                    "out.trimmed.hmmer_split", num_chunks)
+
+                # Pipe trimmed reads to phmmers instead of copying them
+                # to chunked reads files first.
+                self._pipePhmmers(reads_fn=self._trimmed_fl_reads_fn,
+                                  chunkedDomFNs=self.chunked_trimmed_reads_dom_fns,
+                                  outDomFN=self.out_trimmed_reads_dom_fn,
+                                  primer_fn=self.primer_chimera_fn,
+                                  pbmatrix_fn=self.pbmatrix_fn,
+                                  extract_front_back_only=False)
+
+        chimera_ids = self._getChimeraRecord(dom_records,
+                                             self.chimera_detection_opts)
 
         # Only detect chimeras on full-length reads in order to save time
-        self._updateChimeraInfo(suspicous_hits=suspicous_hits,
+        self._updateChimeraInfo(chimera_ids=chimera_ids,
                                 in_read_fn=self._trimmed_fl_reads_fn,
                                 out_flnc_fn=self.out_flnc_fn,
                                 out_flc_fn=self.out_flc_fn,
                                 primer_report_fl_fn=self._primer_report_fl_fn)
+        self._mergeOutputs()
+
+        if need_cleanup:
+            self._cleanup(self.chunked_trimmed_reads_dom_fns)
+        logging.info("Done with chimera detection.")
+
+    def _mergeOutputs(self):
+        """Merge outputs of fl and nfl reads."""
         # full-length non-chimeric reads written to out_flnc.fa
         # non-full-length reads written to out_nfl.fa
         # primer info of fl reads reported to _primer_report_fl_fn
@@ -811,10 +1259,51 @@ class Classifier(object):
         cat_files(src=[self._primer_report_fl_fn, self._primer_report_nfl_fn],
                   dst=self.primer_report_fn)
 
-        if need_cleanup:
-            self._cleanup(self.chunked_trimmed_reads_fns +
-                          self.chunked_trimmed_reads_dom_fns)
-        logging.info("Done with chimera detection.")
+    def runInProcess(self):
+        """Find and trim primers and polyAs, and detect chimeras in a single
+        pass over reads, searching primers in-process using pyhmmer.
+        Reads are processed in batches: primers are searched in front &
+        back segments of a batch, the batch is trimmed, and its trimmed
+        full-length reads are searched for chimeras in memory, so neither
+        fl.trimmed.fasta nor DOM files are written.
+        """
+        logging.info("Start to trim primers and polyAs and detect " +
+                     "chimeras in-process.")
+        opts = self.chimera_detection_opts
+        primer_indices = self._processPrimers(
+            primer_fn=self.primer_fn,
+            window_size=opts.primer_search_window,
+            primer_out_fn=self.primer_front_back_fn,
+            revcmp_primers=False)
+        self._processPrimers(
+            primer_fn=self.primer_fn,
+            window_size=opts.primer_search_window,
+            primer_out_fn=self.primer_chimera_fn,
+            revcmp_primers=True)
+
+        with SimpleFastaReader(self.reads_fn) as fareader, \
+             BatchWriter(self.out_nfl_fn) as nfl_fawriter, \
+             BatchWriter(self._primer_report_nfl_fn) as nfl_reporter, \
+             BatchWriter(self.out_flnc_fn) as writer, \
+             BatchWriter(self.out_flc_fn) as writer_chimera, \
+             BatchWriter(self._primer_report_fl_fn) as fl_reporter:
+            fl_reporter.write("\t".join(ReadAnnotation.fieldsNames()) + "\n")
+            for reads, primer_hits in self._iterReadsWithHits(
+                    fareader, opts.primer_search_window):
+                fl_reads = list(self._trimReads(
+                    reads, primer_hits, primer_indices,
+                    min_seq_len=opts.min_seq_len, min_score=opts.min_score,
+                    change_read_id=self.change_read_id,
+                    ignore_polyA=self.ignore_polyA,
+                    nfl_fawriter=nfl_fawriter, reporter=nfl_reporter))
+                # Only detect chimeras on full-length reads.
+                dom_records = (r for _i, r in self._phmmerInProcess(
+                    self._trimmedReadsBlock(fl_reads),
+                    self.primer_chimera_fn))
+                chimera_ids = self._getChimeraRecord(dom_records, opts)
+                self._writeChimeraInfo(chimera_ids, fl_reads,
+                                       writer, writer_chimera, fl_reporter)
+        logging.info("Done with trimming primers and detecting chimeras.")
 
     def run(self):
         """Classify/annotate reads according to 5' primer seen,
@@ -822,9 +1311,10 @@ class Classifier(object):
         or multiple transcripts with primers seen in the middle of
         a read)
         (1) Create and validate input/output
-        (2) Check phmmer is runnable
+        (2) Check phmmer is runnable, unless pyhmmer is used
         (3) Find primers using phmmer and trim away primers and polyAs
         (4) Detect chimeras from trimmed reads
+        With pyhmmer, (3) and (4) are done in one pass, see runInProcess.
         """
         # Validate input files and required data files.
         self._validateInputs(self.reads_fn, self.primer_fn, self.pbmatrix_fn)
@@ -833,19 +1323,35 @@ class Classifier(object):
         self._validateOutputs(self.out_dir, self.out_all_reads_fn)
 
         # Sanity check phmmer can be called successfully.
-        self._checkPhmmer()
-
-        # Find and trim primers and polyAs.
-        self.runPrimerTrimmer()
+        if not self.use_pyhmmer:
+            self._checkPhmmer()
 
-        # Check whether no fl reads detected.
         no_flnc_errMsg = "No full-length non-chimeric reads detected."
-        if self.summary.num_fl == 0:
-            logging.error(no_flnc_errMsg)
-            raise ClassifierException(no_flnc_errMsg)
+        if self.use_pyhmmer and \
+           not op.exists(self.out_front_back_dom_fn) and \
+           not op.exists(self.out_trimmed_reads_dom_fn):
+            # Find and trim primers and polyAs, and detect chimeras
+            # in one pass.
+            self.runInProcess()
+
+            # Check whether no fl reads detected.
+            if self.summary.num_fl == 0:
+                logging.error(no_flnc_errMsg)
+                raise ClassifierException(no_flnc_errMsg)
+
+            # Generate outputs and primer reports.
+            self._mergeOutputs()
+        else:
+            # Find and trim primers and polyAs.
+            self.runPrimerTrimmer()
+
+            # Check whether no fl reads detected.
+            if self.summary.num_fl == 0:
+                logging.error(no_flnc_errMsg)
+                raise ClassifierException(no_flnc_errMsg)
 
-        # Detect chimeras and generate primer reports.
-        self.runChimeraDetector()
+            # Detect chimeras and generate primer reports.
+            self.runChimeraDetector()
 
         try:
             # Write summary.
@@ -1,12 +1,15 @@
 #!/usr/bin/env python
 """Define options for SGE configuration and the ICE algorithm."""
+import random
 
 
 class SgeOptions(object):
     """Define options to configure SGE."""
     def __init__(self, unique_id, use_sge=False, max_sge_jobs=40,
                  blasr_nproc=24, gcon_nproc=8, quiver_nproc=8):
-        self.unique_id = unique_id
+        # Pick a random unique_id if none is given.
+        self.unique_id = unique_id if unique_id is not None \
+            else random.randint(1, 100000000)
         self.use_sge = use_sge
         self.max_sge_jobs = max_sge_jobs
         self.blasr_nproc = blasr_nproc
@@ -1,7 +1,6 @@
 #!/usr/bin/python
 """Add arugment Parser for subcommand `classify` and `cluster`."""
 import argparse
-import random
 from pbtools.pbtranscript.ClusterOptions import IceOptions
 
 __all__ = ["add_classify_arguments",
@@ -41,7 +40,9 @@ def add_classify_arguments(parser):
 
     hmm_group = parser.add_argument_group("HMMER options")
 
-    helpstr = "Directory to store HMMER output (default: output/)"
+    helpstr = "Directory to store HMMER output. Processed primers and " + \
+        "their *.json caches are kept there to be reused by later " + \
+        "runs with the same primers (default: output/)"
     hmm_group.add_argument("-d", "--outDir",
                            type=str,
                            dest="outDir",
@@ -60,6 +61,19 @@ def add_classify_arguments(parser):
                            dest="cpus",
                            help="Number of CPUs to run HMMER (default: 8)")
 
+    hmm_group.add_argument("--phmmer_threads",
+                           default=1,
+                           type=int,
+                           dest="phmmer_threads",
+                           help="Number of threads of each phmmer, " +
+                                "cpus/phmmer_threads phmmers are run " +
+                                "in parallel. phmmer threads only split " +
+                                "the search over targets, which are a " +
+                                "few primers here, so more than one " +
+                                "rarely pays off. No effect if pyhmmer " +
+                                "is installed, which searches primers " +
+                                "in-process using all cpus (default: 1)")
+
     hmm_group.add_argument("--report",
                            default=None,
                            type=str,
@@ -184,8 +198,9 @@ def add_sge_options(parser, blasr_nproc=False, quiver_nproc=False):
                            type=int,
                            dest="unique_id",
                            action="store",
-                           default=random.randint(1,100000000),
-                           help="Unique ID for submitting SGE jobs.")
+                           default=None,
+                           help="Unique ID for submitting SGE jobs, " +
+                                "default: a random number.")
     if blasr_nproc is True:
         sge_group.add_argument("--blasr_nproc",
                                type=int,
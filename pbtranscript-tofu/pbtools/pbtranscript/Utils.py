@@ -1,15 +1,21 @@
 """Define util functions."""
 import os.path as op
 import os
+import re
 import shutil
 import logging
 import sys
+try:
+    from string import maketrans
+except ImportError:  # Python 3
+    maketrans = str.maketrans
+
+# Translation table of nucleotides to their complements.
+NTMAP = maketrans("acgtnACGTN", "tgcanTGCAN")
 
 def revcmp(seq):
     """Given a sequence return its reverse complement sequence."""
-    NTMAP = {'a':'t', 'c':'g', 't':'a', 'g':'c',
-             'A':'T', 'C':'G', 'T':'A', 'G':'C'}
-    return "".join([NTMAP[x] for x in seq])[::-1]
+    return seq.translate(NTMAP)[::-1]
 
 
 def realpath(f):
@@ -114,8 +120,14 @@ def phred_to_qv(phred):
     return 10 ** -(phred/10.0)
 
 
+# Size of blocks copied at a time by cat_files and append_files.
+COPY_BUFFER_SIZE = 1 << 20
+# Whitespaces at the end of lines, which are stripped by cat_files.
+TRAILING_SPACES_RE = re.compile(b'[ \t\r\f\v]+\n')
+
 def cat_files(src, dst):
-    """Concatenate files in src and save to dst.
+    """Concatenate files in src and save to dst, with trailing
+       whitespaces of each line stripped.
        src --- source file names in a list
        dst --- destinate file name
     """
@@ -124,11 +136,68 @@ def cat_files(src, dst):
     if dst in src:
         raise IOError("Unable to cat a file and save to itself.")
 
-    with open (dst, 'w') as writer:
+    with open(dst, 'wb', COPY_BUFFER_SIZE) as writer:
+        for src_f in src:
+            with open(src_f, 'rb') as reader:
+                while True:
+                    # Copy whole lines in large blocks, and only strip
+                    # trailing whitespaces of lines in each block.
+                    block = reader.read(COPY_BUFFER_SIZE)
+                    if not block:
+                        break
+                    if not block.endswith(b'\n'):
+                        block += reader.readline()
+                    if not block.endswith(b'\n'):  # the last line
+                        block += b'\n'
+                    writer.write(TRAILING_SPACES_RE.sub(b'\n', block))
+
+def append_files(src, dst):
+    """Append files in src to dst as they are, in large blocks.
+       src --- source file names in a list
+       dst --- destinate file name, created if it does not exist.
+    """
+    if dst in src:
+        raise IOError("Unable to append a file to itself.")
+
+    with open(dst, 'ab') as writer:
         for src_f in src:
-            with open(src_f, 'r') as reader:
-                for line in reader:
-                    writer.write(line.rstrip() + '\n')
+            with open(src_f, 'rb') as reader:
+                shutil.copyfileobj(reader, writer, COPY_BUFFER_SIZE)
+
+
+class BatchWriter(object):
+    """Write to a file in batches: strings written are collected, and
+    then written in one call once they add up to 'batch_size' characters.
+    """
+    def __init__(self, file_name, batch_size=4 << 20):
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self._writer = open(file_name, 'w')
+        self._batch, self._size = [], 0
+
+    def write(self, *strings):
+        """Write strings, e.g., write('>', name, '\\n', seq, '\\n')."""
+        self._batch.extend(strings)
+        self._size += sum(map(len, strings))
+        if self._size >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write collected strings to the file."""
+        if len(self._batch) > 0:
+            self._writer.write("".join(self._batch))
+            self._batch, self._size = [], 0
+
+    def close(self):
+        """Flush and close the file."""
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
 def get_all_files_in_dir(dir_path, extension=None):
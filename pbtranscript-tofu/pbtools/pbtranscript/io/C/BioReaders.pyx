@@ -1,8 +1,12 @@
 import re, sys
+import os, mmap
 from collections import namedtuple
 from exceptions import StopIteration
+from libc.stdint cimport uint64_t
+from libc.string cimport memcpy
 
 Interval = namedtuple('Interval', ['start', 'end'])
+SimpleFastaRecord = namedtuple('SimpleFastaRecord', ['name', 'sequence'])
        
 def iter_cigar_string(cigar_string):
     num = cigar_string[0]
@@ -13,6 +17,90 @@ def iter_cigar_string(cigar_string):
         else:
             num += s
             
+
+
+def polyA_start(bytes seq, Py_ssize_t i, int max_non_a=2):
+    """
+    Backtrace from seq[i] to the front of a polyA tail which allows at most
+    max_non_a non-A bases, return index right after the (max_non_a+1)th
+    non-A base left of seq[i], or 0 if there is no such base.
+    Non-A bases are counted 8 bases at a time in a 64-bit word.
+    """
+    cdef const char *s = seq
+    cdef char A = b'A'
+    cdef Py_ssize_t end = i + 1
+    cdef int count = 0
+    cdef uint64_t v
+    if i < 0 or i >= len(seq):
+        raise IndexError("polyA_start index out of range")
+    while end >= 8:
+        memcpy(&v, s + end - 8, 8)
+        # Bytes of v are zero for A, and then 0x01 for non-A bases.
+        v ^= 0x4141414141414141ULL
+        v = ((((v & 0x7f7f7f7f7f7f7f7fULL) + 0x7f7f7f7f7f7f7f7fULL) | v) >> 7) \
+            & 0x0101010101010101ULL
+        # Sum of the bytes is the number of non-A bases in the word.
+        v = (v * 0x0101010101010101ULL) >> 56
+        if count + <int>v > max_non_a:
+            break
+        count += <int>v
+        end -= 8
+    # Locate the non-A base within the last word, or the first bases.
+    while end > 0:
+        end -= 1
+        if s[end] != A:
+            count += 1
+            if count > max_non_a:
+                return end + 1
+    return 0
+
+class SimpleFastaReader:
+    """
+    A simplified FASTA reader meant for speed. The file is mmap'ed and
+    scanned for line starting with '>', instead of being split in Python.
+    Each record only has name (the whole header line) and sequence (lines
+    joined), the same as pbcore FastaRecord.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.f = open(filename, 'rb')
+        self.m = None
+        if os.fstat(self.f.fileno()).st_size > 0:
+            self.m = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        m = self.m
+        if m is None:
+            return
+        size = len(m)
+        start = 0
+        if m[:1] != '>':
+            start = m.find('\n>') + 1
+            if start == 0:
+                return
+        while start < size:
+            end = m.find('\n>', start)
+            if end < 0:
+                end = size
+            eol = m.find('\n', start, end)
+            if eol < 0:
+                eol = end
+            yield SimpleFastaRecord(m[start+1:eol].rstrip('\r'),
+                                    m[eol+1:end].translate(None, '\r\n'))
+            start = end + 1
+
+    def close(self):
+        if self.m is not None:
+            self.m.close()
+            self.m = None
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
                                  
 class SimpleSAMReader:
     """
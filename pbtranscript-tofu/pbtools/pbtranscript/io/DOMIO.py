@@ -5,7 +5,6 @@ __all__ = ["DOMRecord",
 
 
 from pbcore.io import ReaderBase
-from pbcore.io._utils import splitFileContents
 
 
 class DOMRecord(object):
@@ -71,8 +70,8 @@ class DOMReader(ReaderBase):
     """
     def __iter__(self):
         try:
-            lines = splitFileContents(self.file, "\n")
-            for line in lines:
+            # Read lines one by one rather than the whole file at once.
+            for line in self.file:
                 line = line.strip()
                 if len(line) > 0 and line[0] != "#":
                     yield DOMRecord.fromString(line)
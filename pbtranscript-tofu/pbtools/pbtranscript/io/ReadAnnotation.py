@@ -17,6 +17,19 @@ def hasNonPropertyAttr(obj, attr):
     else:
         return False
 
+# Parsed fields of annotation strings, 'attr=val' --> (attr, value).
+# Fields such as 'strand=+' or 'fiveend=31' are shared by many reads.
+_PARSED_FIELDS = {}
+# Maximum number of cached fields, the cache is cleared once it is full.
+_MAX_PARSED_FIELDS = 1 << 15
+
+# Formats of all fields in a report record and in an annotation string,
+# ID followed by fields in the order of ReadAnnotation.fieldsNames().
+_REPORT_FORMAT = "\t".join(["%s"] * 10)
+_ANNOTATION_FORMAT = "%s " + ";".join(
+    ["strand=%s", "fiveseen=%s", "polyAseen=%s", "threeseen=%s",
+     "fiveend=%s", "polyAend=%s", "threeend=%s", "primer=%s", "chimera=%s"])
+
 
 class ReadAnnotation(object):
     """Read annotation class, including the following fields
@@ -43,20 +56,36 @@ class ReadAnnotation(object):
             sid, desc = line.strip().split(' ')[0:2]
             ret = ReadAnnotation(sid, ignore_polyA=ignore_polyA)
             for d in desc.split(';'):
-                attr, val = d.split('=')
-                if hasNonPropertyAttr(ret, attr):
-                    if attr == "strand" or attr == "ID":
-                        setattr(ret, attr, val if val not in ["None", 'NA'] \
-                                else None)
-                    else:
-                        setattr(ret, attr, int(val) if val not in ["None", 'NA'] \
-                                else None)
+                field = _PARSED_FIELDS.get(d)
+                if field is None:
+                    field = cls._parseField(ret, d)
+                if field[0] is not None:
+                    setattr(ret, field[0], field[1])
             return ret
         except Exception as e:
             errMsg = "String not recognized as a valid read annotation:" + \
                     str(e)
             raise ValueError(errMsg)
 
+    @staticmethod
+    def _parseField(obj, d):
+        """Parse a field 'attr=val' of an annotation string, return
+        (attr, value) to set to obj, or (None, None) if attr is not
+        an attribute of obj, and cache the result."""
+        attr, val = d.split('=')
+        if hasNonPropertyAttr(obj, attr):
+            if attr == "strand" or attr == "ID":
+                field = (attr, val if val not in ["None", 'NA'] else None)
+            else:
+                field = (attr, int(val) if val not in ["None", 'NA'] \
+                         else None)
+        else:
+            field = (None, None)
+        if len(_PARSED_FIELDS) >= _MAX_PARSED_FIELDS:
+            _PARSED_FIELDS.clear()
+        _PARSED_FIELDS[d] = field
+        return field
+
     @property
     def fiveseen(self):
         """Return whether 5' primer has been seen."""
@@ -96,8 +125,16 @@ class ReadAnnotation(object):
         #        self.threeseen, self.fiveend, self.polyAend,
         #        self.threeend, self.primer)
 
+    def _formatFields(self, fmt, ID):
+        """Return 'ID' and the other fields formatted by 'fmt' at once,
+        which is much faster than joining xorNA of fields()."""
+        return fmt % (ID, xorNA(self.strand), self.fiveseen,
+                      self.polyAseen, self.threeseen, xorNA(self.fiveend),
+                      xorNA(self.polyAend), xorNA(self.threeend),
+                      xorNA(self.primer), xorNA(self.chimera))
+
     def __repr__(self):
-        return "\t".join([xorNA(x) for x in self.fields()])
+        return self._formatFields(_REPORT_FORMAT, xorNA(self.ID))
 
     def toReportRecord(self):
         """Return a string to represent an annotation in a report."""
@@ -105,8 +142,6 @@ class ReadAnnotation(object):
 
     def toAnnotation(self):
         """Return a string to represent an annotation."""
-        return str(self.ID) + " " + ";".join(
-            [x + "=" + xorNA(y) for x, y in
-             zip(self.fieldsNames(), self.fields())[1:]])
+        return self._formatFields(_ANNOTATION_FORMAT, str(self.ID))
 
 
@@ -108,7 +108,8 @@ class PBTranscript(PBMultiToolRunner):
                                  opts=opts,
                                  out_flnc_fn=self.args.flnc_fa,
                                  out_nfl_fn=self.args.nfl_fa,
-                                 ignore_polyA=self.args.ignore_polyA)
+                                 ignore_polyA=self.args.ignore_polyA,
+                                 phmmer_threads=self.args.phmmer_threads)
                 obj.run()
             elif cmd == 'cluster':
                 ice_opts = IceOptions(cDNA_size=self.args.cDNA_size,
@@ -1,5 +1,6 @@
 from setuptools import setup, find_packages
 from distutils.extension import Extension
+import os
 import sys
 
 __author__ = "jdrake|etseng|yli@pacificbiosciences.com"
@@ -23,6 +24,15 @@ ext_modules = [Extension("pbtools.pbtranscript.findECE",
                          ["pbtools/pbtranscript/branch/C/modified_bx_intervals/intersection_unique.c"]),
               ]
 
+# Optimize extensions for the CPU of the build machine if PBTRANSCRIPT_NATIVE
+# is set, e.g., PBTRANSCRIPT_NATIVE=1 python setup.py install. Binaries built
+# so may not run on other machines.
+if os.environ.get('PBTRANSCRIPT_NATIVE'):
+    for ext in ext_modules:
+        ext.extra_compile_args += ['-O3', '-march=native', '-funroll-loops',
+                                   '-flto']
+        ext.extra_link_args += ['-flto']
+
 setup(
 #    setup_requires=['setuptools_cython'],
     name = 'pbtools.pbtranscript',
@@ -55,7 +65,11 @@ setup(
     zip_safe=False,
     install_requires=[
         'pbcore >= 0.6.3',
-        ]
+        ],
+    # Search primers in-process instead of running phmmer.
+    extras_require={
+        'pyhmmer': ['pyhmmer >= 0.11'],
+        }
     )
 
 #'pbtools/pbtranscript/io/FastaSplitter.py',
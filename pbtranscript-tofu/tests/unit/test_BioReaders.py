@@ -0,0 +1,96 @@
+"""Test pbtools.pbtranscript.BioReaders."""
+
+import unittest
+import random
+import os.path as op
+from pbcore.io import FastaReader
+from pbtools.pbtranscript.BioReaders import SimpleFastaReader, polyA_start
+
+
+class TestSimpleFastaReader(unittest.TestCase):
+    """Test SimpleFastaReader."""
+    def setUp(self):
+        """Initialize."""
+        self.root_dir = op.dirname(op.dirname(op.abspath(__file__)))
+        self.data_dir = op.join(self.root_dir, "data")
+        self.out_dir = op.join(self.root_dir, "out")
+
+    def _write(self, content):
+        """Write 'content' to a FASTA file and return its name."""
+        fn = op.join(self.out_dir, "test_SimpleFastaReader.fa")
+        with open(fn, 'wb') as writer:
+            writer.write(content)
+        return fn
+
+    @staticmethod
+    def _records(reader):
+        """Return records of 'reader' as a list of (name, sequence)."""
+        return [(r.name, r.sequence) for r in reader]
+
+    def _read(self, content):
+        """Return records SimpleFastaReader reads from 'content'."""
+        with SimpleFastaReader(self._write(content)) as reader:
+            return self._records(reader)
+
+    def test_same_as_FastaReader(self):
+        """Test SimpleFastaReader reads what pbcore FastaReader reads."""
+        cases = {"empty": "",
+                 "multi-line": ">r1 a b\nAC\nGT\n>r2\nA\nC\nG",
+                 "CRLF": ">r1 a b\r\nAC\r\nGT\r\n>r2\r\nACG\r\n"}
+        for name, content in cases.items():
+            fn = self._write(content)
+            with SimpleFastaReader(fn) as reader:
+                self.assertEqual(self._records(reader),
+                                 self._records(FastaReader(fn)), name)
+        self.assertEqual(self._read(cases["CRLF"]),
+                         [("r1 a b", "ACGT"), ("r2", "ACG")])
+
+        fn = op.join(self.data_dir, "reads_of_insert.fasta")
+        with SimpleFastaReader(fn) as reader:
+            self.assertEqual(self._records(reader),
+                             self._records(FastaReader(fn)))
+
+    def test_malformed(self):
+        """Test SimpleFastaReader on FASTA which pbcore rejects."""
+        # Text before the first record is skipped.
+        self.assertEqual(self._read("\n# reads\n>r1\nAC\n"),
+                         [("r1", "AC")])
+        self.assertEqual(self._read("no records\n"), [])
+        # Records without sequence are read as empty sequences.
+        self.assertEqual(self._read(">r1\n>r2\nAC\n>r3\n"),
+                         [("r1", ""), ("r2", "AC"), ("r3", "")])
+
+
+class TestPolyAStart(unittest.TestCase):
+    """Test polyA_start."""
+    @staticmethod
+    def _backtrace(seq, i, max_non_a=2):
+        """Backtrace base by base, as Classifier._findPolyA used to."""
+        nonA = 0
+        while i >= 0:
+            nonA += (seq[i] != 'A')
+            if nonA > max_non_a:
+                break
+            i -= 1
+        return i + 1
+
+    def test_polyA_start(self):
+        """Test polyA_start returns what the base by base backtrace does."""
+        seqs = ["A", "C", "AAAAAAAA", "CCCCCCCC", "CA" + "A" * 200 + "G",
+                "GCGCGC" + "A" * 100 + "C" + "A" * 100 + "G" * 10]
+        rand = random.Random(0)
+        for n in range(1, 40) + [63, 64, 65, 200]:
+            for p in [0.02, 0.1, 0.5]:
+                seqs.append("".join("A" if rand.random() > p else
+                                    rand.choice("CGTN") for _i in range(n)))
+        for seq in seqs:
+            for i in range(len(seq)):
+                for max_non_a in [0, 2, 5]:
+                    self.assertEqual(polyA_start(seq, i, max_non_a),
+                                     self._backtrace(seq, i, max_non_a),
+                                     (seq, i, max_non_a))
+        self.assertRaises(IndexError, polyA_start, "AAA", 3)
+        self.assertRaises(IndexError, polyA_start, "AAA", -1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,11 +3,12 @@
 import unittest
 import os
 import os.path as op
-from pbtools.pbtranscript.Classifier import Classifier, PBRead
+from pbtools.pbtranscript.Classifier import Classifier, PBRead, FRONT, BACK
 from pbtools.pbtranscript.io.DOMIO import DOMRecord
 from collections import namedtuple
 
 import filecmp
+import numpy as np
 
 class Test_Classifier(unittest.TestCase):
     """Test Classifier."""
@@ -49,25 +50,84 @@ class Test_Classifier(unittest.TestCase):
                             revcmp_primers=True)
         self.assertTrue(filecmp.cmp(outPFN2, stdoutPFN2))
 
-    def test_chunkReads(self):
-        """Test function _chunkReads(readsFN, chunkSize, chunkedReadsFNs)."""
+    def test_processPrimers_cache(self):
+        """Test that _processPrimers() reuses primers processed from the
+        same input and arguments."""
+        pbPFN = op.join(self.testDir, "data/primers.fa")
+        outPFN = op.join(self.testDir, "out/test_primers_out_cache.fa")
+        stdoutPFN = op.join(self.testDir, "stdout/test_primers_out_2.fa")
+        for fn in [outPFN, outPFN + ".json"]:
+            if op.exists(fn):
+                os.remove(fn)
         obj = Classifier()
-        readsFN = op.join(self.testDir, "data/test_chunkReads_1.fa")
-        chunkedReadsFN = op.join(self.testDir,
-                                 "out/test_chunkReads_1.fa")
-        if op.exists(chunkedReadsFN):
-            os.remove(chunkedReadsFN)
-        stdoutChunkedReadsFN = op.join(self.testDir,
-                                       "stdout/test_chunkReads_1.fa")
 
-        obj._chunkReads(readsFN, 10, [chunkedReadsFN])
-        self.assertTrue(filecmp.cmp(chunkedReadsFN, stdoutChunkedReadsFN))
+        indices = obj._processPrimers(primer_fn=pbPFN, window_size=50,
+                                      primer_out_fn=outPFN,
+                                      revcmp_primers=False)
+        with open(outPFN, 'w') as writer:
+            writer.write("reused")
+        self.assertEqual(obj._processPrimers(primer_fn=pbPFN, window_size=50,
+                                             primer_out_fn=outPFN,
+                                             revcmp_primers=False), indices)
+        self.assertEqual(open(outPFN).read(), "reused")
+
+        # Different arguments, process primers again.
+        obj._processPrimers(primer_fn=pbPFN, window_size=60,
+                            primer_out_fn=outPFN, revcmp_primers=False)
+        self.assertTrue(filecmp.cmp(outPFN, stdoutPFN))
+
+        # Invalid cache, process primers again.
+        for cache in ["not json", "[]", "{}"]:
+            with open(outPFN, 'w') as writer:
+                writer.write("reused")
+            with open(outPFN + ".json", 'w') as writer:
+                writer.write(cache)
+            self.assertEqual(obj._processPrimers(primer_fn=pbPFN,
+                                                 window_size=60,
+                                                 primer_out_fn=outPFN,
+                                                 revcmp_primers=False),
+                             indices)
+            self.assertTrue(filecmp.cmp(outPFN, stdoutPFN))
+
+    def test_numChunks(self):
+        """Test function _numChunks(num_reads)."""
+        obj = Classifier(cpus=8, phmmer_threads=1)
+        self.assertEqual(obj._numChunks(0), 1)
+        self.assertEqual(obj._numChunks(5), 1)
+        self.assertEqual(obj._numChunks(250), 3)
+        self.assertEqual(obj._numChunks(1000), 8)
+        self.assertEqual(obj._numChunks(80000), 8)
+        # 8 cpus, 4 phmmers of 2 threads each.
+        obj = Classifier(cpus=8, phmmer_threads=2)
+        self.assertEqual(obj._numChunks(80000), 4)
+
+    def test_pipePhmmers(self):
+        """Test that _pipePhmmers() runs phmmers of phmmer_threads threads."""
+        readsFN = op.join(self.testDir, "data/test_phmmer.fa")
+        primerFN = op.join(self.testDir, "data/primers.fa")
+        outDomFN = op.join(self.testDir, "out/test_pipePhmmers.dom")
+        for threads, num_chunks in [(1, 1), (2, 2)]:
+            domFNs = [op.join(self.testDir,
+                              "out/test_pipePhmmers.%d.dom" % i)
+                      for i in range(num_chunks)]
+            obj = Classifier(cpus=8, phmmer_threads=threads)
+            cpus = []
+            def phmmerCmd(reads_fn, domFN, primer_fn, pbmatrix_fn, n=1):
+                """Record --cpu of phmmer and copy its stdin to domFN."""
+                cpus.append(n)
+                return ["sh", "-c", "cat > " + domFN]
+            obj._phmmerCmd = phmmerCmd
+            obj._pipePhmmers(reads_fn=readsFN, chunkedDomFNs=domFNs,
+                             outDomFN=outDomFN, primer_fn=primerFN,
+                             pbmatrix_fn=obj.pbmatrix_fn)
+            self.assertEqual(cpus, [threads] * num_chunks)
 
     def test_getBestFrontBackRecord(self):
         """Test function _parseBestFrontBackRecord()."""
         obj = Classifier()
         domFN = op.join(self.testDir, "data/test_parseHmmDom.dom")
-        front, back = obj._getBestFrontBackRecord(domFN)
+        hits = obj._getBestFrontBackRecord(domFN)
+        front, back = hits.records(FRONT), hits.records(BACK)
         # In the following, verify the front and back are equivalent
         # to stdout/test_parseHmmDom_dFront/Back.txt
         def prettystr(d):
@@ -108,23 +168,44 @@ class Test_Classifier(unittest.TestCase):
         self.assertEqual(obj._findPolyA(seq1), 188)
         self.assertEqual(obj._findPolyA(seq2), 196)
         self.assertEqual(obj._findPolyA(seq3), -1)
+        # polyA tails longer than the first backtrace window.
+        seq4 = "GCGCGC" + "A" * 100 + "C" + "A" * 100 + "G" * 10
+        self.assertEqual(obj._findPolyA(seq4), 5)
+        seq5 = "CA" + "A" * 200 + "GAAAAAAAAG"
+        self.assertEqual(obj._findPolyA(seq5), 0)
+
+    def test_trimRange(self):
+        """Test function _trimRange()."""
+        # 5' primer, polyA and 3' primer seen, + strand of read [100, 400).
+        self.assertEqual(Classifier._trimRange(300, 30, 280, 250,
+                                               100, 400, "+"),
+                         (30, 250, 130, 350))
+        # polyA not seen, - strand.
+        self.assertEqual(Classifier._trimRange(300, 30, 280, -1,
+                                               100, 400, "-"),
+                         (30, 280, 370, 120))
+        # Only 5' primer seen.
+        self.assertEqual(Classifier._trimRange(300, 30, None, -1,
+                                               100, 400, "+"),
+                         (30, 300, 130, 400))
+        self.assertEqual(Classifier._trimRange(300, None, None, -1,
+                                               100, 400, "-"),
+                         (0, 300, 400, 100))
 
     def test_pickBestPrimerCombo(self):
         """Test funciton _pickBestPrimerCombo()."""
         obj = Classifier()
         domFN = op.join(self.testDir, "data/test_parseHmmDom.dom")
-        front, back = obj._getBestFrontBackRecord(domFN)
+        hits = obj._getBestFrontBackRecord(domFN)
 
         # Now pick up the best primer combo
         movie = "m131018_081703_42161_c100585152550000001823088404281404_s1_p0"
         rids = [movie + "/" + str(zmw) + "/ccs" for zmw in [43, 45, 54]]
-        res = obj._pickBestPrimerCombo(
-            front[rids[0]], back[rids[0]], [0, 1], 10)
+        res = obj._pickBestPrimerCombo(hits, rids[0], [0, 1], 10)
         self.assertTrue(res[2] is None)
         self.assertTrue(res[3] is None)
 
-        res = obj._pickBestPrimerCombo(
-            front[rids[1]], back[rids[1]], [0, 1], 10)
+        res = obj._pickBestPrimerCombo(hits, rids[1], [0, 1], 10)
 
         fw = DOMRecord("F1", movie + "/45/ccs", 33.0, 0, 30, 31, 0, 30, 100)
         rc = DOMRecord("R1", movie + "/45/ccs", 27.2, 0, 25, 25, 0, 25, 100)
@@ -133,14 +214,33 @@ class Test_Classifier(unittest.TestCase):
         self.assertTrue(str(fw) == str(res[2]))
         self.assertTrue(str(rc) == str(res[3]))
 
-        res = obj._pickBestPrimerCombo(
-            front[rids[2]], back[rids[2]], [0, 1], 10)
+        res = obj._pickBestPrimerCombo(hits, rids[2], [0, 1], 10)
         rc = DOMRecord("R1", movie + "/54/ccs", 22.3, 0, 25, 25, 0, 27, 100)
         self.assertEqual(res[0], 1)
         self.assertEqual(res[1], "+")
         self.assertTrue(res[2] is None)
         self.assertTrue(str(res[3]) == str(rc))
 
+    def test_isChimera(self):
+        """Test function _isChimera(ids, chimera_ids)."""
+        chimera_ids = np.unique(np.array(["m/2/0_10", "m/1/0_20"], dtype=str))
+        ids = ["m/1/0_20", "m/0/0_10", "m/2/0_10", "m/3/0_10", "m/1/0_2"]
+        self.assertEqual(list(Classifier._isChimera(ids, chimera_ids)),
+                         [True, False, True, False, False])
+        self.assertEqual(list(Classifier._isChimera(
+            ids, np.array([], dtype=str))), [False] * 5)
+
+    def test_newReadId(self):
+        """Test function _newReadId()."""
+        A = namedtuple('A', 'name sequence')
+        ccs = PBRead(A("movie/10/ccs", "A" * 98))
+        subread = PBRead(A("movie/10/2_100", "A" * 98))
+        newReadId = Classifier._newReadId(True)
+        self.assertEqual(newReadId(ccs, 5, 90), "movie/10/5_90_CCS")
+        self.assertEqual(newReadId(subread, 90, 5), "movie/10/90_5")
+        newReadId = Classifier._newReadId(False)
+        self.assertEqual(newReadId(ccs, 5, 90), "movie/10/ccs")
+
     def test_PBRead(self):
         """Test class PBRead."""
         A = namedtuple('A', 'name sequence')
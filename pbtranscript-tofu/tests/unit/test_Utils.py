@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 
 import unittest
+import os
 import os.path as op
 import filecmp
-from pbtools.pbtranscript.Utils import cat_files, filter_sam
+from pbtools.pbtranscript.Utils import cat_files, append_files, \
+    BatchWriter, filter_sam, revcmp
 
 class TestUtils(unittest.TestCase):
     """Test pbtools.pbtranscript.Utils"""
@@ -14,6 +16,12 @@ class TestUtils(unittest.TestCase):
         self.out_dir = op.join(self.root_dir, "out")
         self.stdout_dir = op.join(self.root_dir, "stdout")
 
+    def test_revcmp(self):
+        """Test revcmp."""
+        self.assertEqual(revcmp("AACGTTGCAn"), "nTGCAACGTT")
+        self.assertEqual(revcmp("acgtNACGT"), "ACGTNacgt")
+        self.assertEqual(revcmp(""), "")
+
     def test_cat_files(self):
         """Test cat_files."""
         fn_1 = op.join(self.data_dir, "primers.fa")
@@ -28,6 +36,28 @@ class TestUtils(unittest.TestCase):
         self.assertTrue(filecmp.cmp(out_fn_1, fn_1))
         self.assertTrue(filecmp.cmp(out_fn_2, std_out_fn_2))
 
+    def test_append_files(self):
+        """Test append_files."""
+        fn_1 = op.join(self.data_dir, "primers.fa")
+        fn_2 = op.join(self.data_dir, "test_phmmer.fa")
+        out_fn = op.join(self.out_dir, "test_append")
+        if op.exists(out_fn):
+            os.remove(out_fn)
+
+        append_files(src=[fn_1], dst=out_fn)
+        append_files(src=[fn_2, fn_1], dst=out_fn)
+        expected = "".join(open(fn).read() for fn in [fn_1, fn_2, fn_1])
+        self.assertEqual(open(out_fn).read(), expected)
+
+    def test_BatchWriter(self):
+        """Test BatchWriter."""
+        out_fn = op.join(self.out_dir, "test_BatchWriter")
+        with BatchWriter(out_fn, batch_size=8) as writer:
+            writer.write(">", "read", "\n")
+            writer.write("ACGT", "\n")  # flushed
+            writer.write(">r2\n")
+        self.assertEqual(open(out_fn).read(), ">read\nACGT\n>r2\n")
+
     def test_filter_sam(self):
         """Test filter_sam."""
         in_sam = op.join(self.data_dir, "test_filter_sam.sam")